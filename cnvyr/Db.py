@@ -1,7 +1,10 @@
+import asyncio
 import contextlib
 import dataclasses
 import datetime
 import enum
+import functools
+import itertools
 import logging
 import typing
 
@@ -9,6 +12,7 @@ import asyncstdlib
 import psycopg
 import psycopg.rows
 import psycopg.sql
+import psycopg_pool
 
 
 @dataclasses.dataclass(frozen=True, kw_only=True)
@@ -31,6 +35,85 @@ class Item:
             yield cls(**d)
 
 
+@dataclasses.dataclass(frozen=True, kw_only=True)
+class Table:
+    name: str
+    fields: tuple[str, ...]
+    enums: tuple[bool, ...]
+    columns: tuple[str, ...]
+
+    @classmethod
+    def of(cls, t: type[Item]):
+        fields = dataclasses.fields(t)
+        return cls(
+            name=t.__name__.lower(),
+            fields=tuple(f.name for f in fields),
+            enums=tuple(isinstance(f.type, type) and issubclass(f.type, enum.Enum) for f in fields),
+            columns=tuple(cls._column(f) for f in fields),
+        )
+
+    @staticmethod
+    def _column(f: dataclasses.Field):
+        f_name = f.name.lower()
+        if f_name == "id":
+            return f"{f_name} bigserial primary key not null"
+
+        field = [f_name]
+        if f.type | bool == f.type:
+            field.append("boolean")
+        elif f.type | str == f.type:
+            field.append("text")
+        elif f.type | int == f.type:
+            field.append("bigint")
+        elif f.type | float == f.type:
+            field.append("double precision")
+        elif f.type | bytes == f.type:
+            field.append("bytea")
+        elif f.type | datetime.datetime == f.type:
+            field.append("timestamp")
+        elif isinstance(f.type, type) and issubclass(f.type, enum.Enum):
+            field.append("cnvyr_enum")
+        else:
+            raise ValueError(f"can not convert type {f.type} to database type")
+
+        if typing.Union[f.type, None] != f.type:
+            field.append("not null")
+
+        return " ".join(field)
+
+    @functools.cached_property
+    def ddl(self):
+        return [f"create table if not exists {self.name}({', '.join(self.columns)})"] + [
+            f"create index if not exists {self.name}_{f.lower()} on {self.name}({f.lower()})"
+            for f in self.fields
+            if f != "id"
+        ]
+
+    @functools.cached_property
+    def insert(self):
+        fields = [f for f in self.fields if f != "id"]
+        return (
+            f"insert into {self.name}({', '.join(fields)}) values ({', '.join(f'%({f})s' for f in fields)}) "
+            "returning id"
+        )
+
+    @functools.cached_property
+    def copy(self):
+        return f"copy {self.name}({', '.join(self.fields)}) from stdin"
+
+    @functools.cache
+    def update(self, keys: tuple[str, ...], where: tuple[str, ...]):
+        return (
+            f"update {self.name} set "
+            + ", ".join(f"{k}=%({k})s" for k in keys)
+            + " where "
+            + " and ".join(f"{k}=%(_{k})s" for k in where)
+        )
+
+    def asdict(self, item: Item):
+        return {k: getattr(item, k).name if e else getattr(item, k) for k, e in zip(self.fields, self.enums)}
+
+
 @dataclasses.dataclass(frozen=False, kw_only=True)
 class Db:
     user: str
@@ -38,26 +121,71 @@ class Db:
     name: str
     host: str = "127.0.0.1"
     port: int = 5432
+    pool_min_size: int = 1
+    pool_max_size: int | None = None
+    reconnect_delay: float = 1.0
+    copy_threshold: int = 64
 
     async def init(self):
-        self._connection = await self._new_connection
         self._enum_values_cache: set[str] = set()
+        self._ddl_lock = asyncio.Lock()
+        self._tables: dict[type[Item], Table] = {}
+        self._created_tables: set[Table] = set()
+        if self.pool_max_size is None:
+            self._connection = await self._new_connection
+        else:
+            self._pool = psycopg_pool.AsyncConnectionPool(
+                self._conninfo,
+                min_size=self.pool_min_size,
+                max_size=self.pool_max_size,
+                kwargs={"autocommit": True},
+                check=psycopg_pool.AsyncConnectionPool.check_connection,
+                open=False,
+            )
+            await self._pool.open(wait=True)
+
+    async def close(self):
+        if self.pool_max_size is None:
+            await self._connection.close()
+        else:
+            await self._pool.close()
+
+    @property
+    def _conninfo(self):
+        return f"host={self.host} port={self.port} dbname={self.name} user={self.user} password={self.password}"
 
     @property
     async def _new_connection(self):
+        delay = self.reconnect_delay
         while True:
             try:
-                return await psycopg.AsyncConnection.connect(
-                    f"host={self.host} port={self.port} dbname={self.name} user={self.user} password={self.password}",
-                    autocommit=True,
-                )
+                return await psycopg.AsyncConnection.connect(self._conninfo, autocommit=True)
             except Exception as e:
                 logging.error(f"Exception ({e.__class__.__name__}, {e}) when connecting to db {self}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60 * self.reconnect_delay)
 
-    @asyncstdlib.cached_property
+    @contextlib.asynccontextmanager
+    async def _connect(self):
+        if self.pool_max_size is None:
+            if self._connection.closed:
+                self._connection = await self._new_connection
+            yield self._connection
+        else:
+            async with self._pool.connection() as connection:
+                yield connection
+
+    async def _reconnect(self):
+        if self.pool_max_size is None:
+            await self._connection.close()
+            self._connection = await self._new_connection
+        else:
+            await self._pool.check()
+
+    @asyncstdlib.cached_property(asyncio.Lock)
     async def _create_log_table(self):
         await self._create_enum
-        async with self._connection.cursor() as acur:
+        async with self._connect() as connection, connection.cursor() as acur:
             await acur.execute(
                 "create table if not exists cnvyr_log (id bigserial primary key not null, "
                 "datetime timestamp default(now() at time zone 'utc') not null, "
@@ -71,10 +199,10 @@ class Db:
             await acur.execute("create index if not exists cnvyr_log_key on cnvyr_log(key)")
             await acur.execute("create index if not exists cnvyr_log_value on cnvyr_log(value)")
 
-    @asyncstdlib.cached_property
+    @asyncstdlib.cached_property(asyncio.Lock)
     async def _create_errors_table(self):
         await self._create_enum
-        async with self._connection.cursor() as acur:
+        async with self._connect() as connection, connection.cursor() as acur:
             await acur.execute(
                 "create table if not exists cnvyr_errors (id bigserial primary key not null, "
                 "first timestamp default(now() at time zone 'utc') not null, "
@@ -89,16 +217,17 @@ class Db:
             await acur.execute("create index if not exists cnvyr_errors_error_type on cnvyr_errors(error_type)")
             await acur.execute("create index if not exists cnvyr_errors_error_text on cnvyr_errors(error_text)")
 
-    @asyncstdlib.cached_property
+    @asyncstdlib.cached_property(asyncio.Lock)
     async def _create_enum(self):
-        try:
-            await self._connection.execute("create type cnvyr_enum as enum ()")
-        except psycopg.errors.DuplicateObject:
-            async for r in await self._connection.execute(
-                "select e.enumlabel from pg_enum as e join pg_type as t on e.enumtypid=t.oid where t.typname=%s",
-                ("cnvyr_enum",),
-            ):
-                self._enum_values_cache.add(r[0])
+        async with self._connect() as connection:
+            try:
+                await connection.execute("create type cnvyr_enum as enum ()")
+            except psycopg.errors.DuplicateObject:
+                async for r in await connection.execute(
+                    "select e.enumlabel from pg_enum as e join pg_type as t on e.enumtypid=t.oid where t.typname=%s",
+                    ("cnvyr_enum",),
+                ):
+                    self._enum_values_cache.add(r[0])
 
     def _enum_values(self, source: str | type[enum.Enum] | type[Item]):
         result: set[str] = set()
@@ -119,84 +248,70 @@ class Db:
             names |= self._enum_values(s)
 
         await self._create_enum
-        names -= self._enum_values_cache
-
-        if names:
-            async with self._connection.cursor() as acur:
-                for n in names:
-                    await acur.execute(f"alter type cnvyr_enum add value if not exists '{n}'")
-            self._enum_values_cache |= {*names}
+        async with self._ddl_lock:
+            names -= self._enum_values_cache
+            if names:
+                async with self._connect() as connection, connection.cursor() as acur:
+                    for n in names:
+                        await acur.execute(f"alter type cnvyr_enum add value if not exists '{n}'")
+                self._enum_values_cache |= {*names}
+
+    def _table(self, t: type[Item]):
+        if (result := self._tables.get(t)) is None:
+            result = self._tables[t] = Table.of(t)
+        return result
 
     def _table_name(self, item: Item):
-        return type(item).__name__.lower()
-
-    async def _create_table(self, c: Item, acur: psycopg.AsyncCursor):
-        t_name = self._table_name(c)
-        ct_query = f"create table if not exists {t_name}"
-        fields = []
-        ci_queries = []
-
-        for f in dataclasses.fields(c):
-            f_name = f.name.lower()
-            if f_name == "id":
-                fields.append(f"{f_name} bigserial primary key not null")
-            else:
-
-                ci_queries.append(f"create index if not exists {t_name}_{f_name} on {t_name}({f_name})")
-                field = [f_name]
-
-                if f.type | bool == f.type:
-                    field.append("boolean")
-                elif f.type | str == f.type:
-                    field.append("text")
-                elif f.type | int == f.type:
-                    field.append("bigint")
-                elif f.type | float == f.type:
-                    field.append("double precision")
-                elif f.type | bytes == f.type:
-                    field.append("bytea")
-                elif f.type | datetime.datetime == f.type:
-                    field.append("timestamp")
-                elif isinstance(f.type, type) and issubclass(f.type, enum.Enum):
-                    field.append("cnvyr_enum")
-                else:
-                    raise ValueError(f"can not convert type {f.type} to database type")
-
-                if typing.Union[f.type, None] != f.type:
-                    field.append("not null")
-
-                fields.append(" ".join(field))
-
-        ct_query += f"({', '.join(fields)})"
-
-        for q in [ct_query] + ci_queries:
-            await acur.execute(q)
+        return self._table(type(item)).name
+
+    async def _create_tables(self, *items: Item):
+        if not (tables := {self._table(type(i)) for i in items} - self._created_tables):
+            return
+        async with self._ddl_lock, self._connect() as connection, connection.cursor() as acur:
+            for t in tables - self._created_tables:
+                for q in t.ddl:
+                    await acur.execute(q)
+                self._created_tables.add(t)
 
     async def wipe(self):
-        async with self._connection.cursor() as acur:
+        async with self._connect() as connection, connection.cursor() as acur:
             await acur.execute("drop schema public cascade")
             await acur.execute("create schema public")
             await acur.execute("grant all on schema public to postgres")
             await acur.execute("grant all on schema public to public")
+        self._enum_values_cache.clear()
+        self._created_tables.clear()
+        for p in ("_create_enum", "_create_log_table", "_create_errors_table"):
+            self.__dict__.pop(p, None)
 
     async def _create(self, item: Item, acur: psycopg.AsyncCursor):
-        await self._create_table(item, acur)
-        query = f"insert into {self._table_name(item)}"
-
-        fields = self._asdict(item)
-        del fields["id"]
-        query += "(" + ", ".join(fields) + ") values (" + ", ".join(f"%({k})s" for k in fields) + ")"
-        query += " returning id"
-
-        await acur.execute(query, fields)
+        t = self._table(type(item))
+        await acur.execute(t.insert, t.asdict(item), prepare=True)
         result = await acur.fetchone()
 
         if result is None:
             raise ValueError(f"result of insert is None")
         return result[0]
 
+    async def _create_many(self, operation: enum.Enum, items: list[Item], acur: psycopg.AsyncCursor):
+        t = self._table(type(items[0]))
+        await acur.execute(
+            "select nextval(pg_get_serial_sequence(%s, 'id')) from generate_series(1, %s)", (t.name, len(items))
+        )
+        created = [dataclasses.replace(i, id=r[0]) for i, r in zip(items, await acur.fetchall())]
+
+        async with acur.copy(t.copy) as copy:
+            for c in created:
+                await copy.write_row(tuple(t.asdict(c).values()))
+
+        async with acur.copy("copy cnvyr_log(item_type, item_id, operation, key, value) from stdin") as copy:
+            for c in created:
+                for k, v in self._diff(None, c).items():
+                    if v is not None:
+                        await copy.write_row((type(c).__name__, c.id, operation.name, k, str(v)))
+
     def _asdict(self, item: Item):
-        return {k: v.name if isinstance(v, enum.Enum) else v for k, v in dataclasses.asdict(item).items()}
+        return self._table(type(item)).asdict(item)
 
     def _diff(self, old: Item | None, new: Item):
         d_old = self._asdict(old) if old is not None else {}
@@ -213,20 +328,18 @@ class Db:
         if old.id != new.id:
             raise ValueError(f"old item id {old.id} != {new.id}")
 
-        query = f"update {t_name} set "
-
         diff = self._diff(old, new)
         if not diff:
             return
         for k, v in diff.items():
             if k in Item.__dataclass_fields__:
                 raise ValueError(f"attempt to change constant field: ({k}, {v})")
-        query += ", ".join(f"{k}=%({k})s" for k in diff)
-
         rdiff = self._diff(new, old)
-        query += " where " + " and ".join(f"{k}=%(_{k})s" for k in rdiff.keys())
 
-        await acur.execute(query, diff | {f"_{k}": v for k, v in rdiff.items()})
+        await acur.execute(
+            self._table(type(old)).update(tuple(sorted(diff)), tuple(sorted(rdiff))),
+            diff | {f"_{k}": v for k, v in rdiff.items()},
+        )
         result = acur.pgresult
         status = acur.statusmessage
         if not (result and status):
@@ -245,17 +358,23 @@ class Db:
     async def transaction(self, operation: enum.Enum, *actions: Item | tuple[Item, Item]):
         await self._add_enum_values(type(operation), *[type(a) if isinstance(a, Item) else type(a[1]) for a in actions])
         await self._create_log_table
-        async with self._connection.cursor() as acur:
-            async with self._connection.transaction():
-                for a in actions:
-                    if isinstance(a, Item):
-                        received_id = await self._create(a, acur)
-                        await self._log(operation, None, dataclasses.replace(a, id=received_id), acur)
-                    elif isinstance(a, tuple) and len(a) == 2 and isinstance(a[0], Item) and isinstance(a[1], Item):
-                        await self._log(operation, *a, acur)
-                        await self._update(*a, acur)
-                    else:
-                        raise ValueError(f"expect Item or two-Item tuple, got {a}")
+        await self._create_tables(*[a for a in actions if isinstance(a, Item)])
+        async with self._connect() as connection, connection.cursor() as acur:
+            async with connection.transaction():
+                for t, run in itertools.groupby(actions, key=lambda a: type(a) if isinstance(a, Item) else None):
+                    run = list(run)
+                    if t is not None and len(run) >= self.copy_threshold:
+                        await self._create_many(operation, run, acur)
+                        continue
+                    for a in run:
+                        if isinstance(a, Item):
+                            received_id = await self._create(a, acur)
+                            await self._log(operation, None, dataclasses.replace(a, id=received_id), acur)
+                        elif isinstance(a, tuple) and len(a) == 2 and isinstance(a[0], Item) and isinstance(a[1], Item):
+                            await self._log(operation, *a, acur)
+                            await self._update(*a, acur)
+                        else:
+                            raise ValueError(f"expect Item or two-Item tuple, got {a}")
 
     @contextlib.asynccontextmanager
     async def error_logging(self, operation: enum.Enum):
@@ -263,28 +382,30 @@ class Db:
             await self._create_errors_table
             await self._add_enum_values(type(operation))
             yield
-            await self._connection.execute("delete from cnvyr_errors where operation=%s", (operation.name,))
+            async with self._connect() as connection:
+                await connection.execute("delete from cnvyr_errors where operation=%s", (operation.name,))
         except Exception as e:
             error_type = type(e).__name__
             while True:
                 try:
                     await self._add_enum_values(error_type)
-                    await self._connection.execute(
-                        "insert into cnvyr_errors(operation, error_type, error_text) values (%s, %s, %s) "
-                        "on conflict (operation, error_type, error_text) do update "
-                        "set last=now() at time zone 'utc', amount=cnvyr_errors.amount+1",
-                        (operation.name, error_type, str(e)),
-                    )
+                    async with self._connect() as connection:
+                        await connection.execute(
+                            "insert into cnvyr_errors(operation, error_type, error_text) values (%s, %s, %s) "
+                            "on conflict (operation, error_type, error_text) do update "
+                            "set last=now() at time zone 'utc', amount=cnvyr_errors.amount+1",
+                            (operation.name, error_type, str(e)),
+                        )
                     break
                 except Exception as db_e:
                     logging.error(
                         f"Exception ({db_e.__class__.__name__}, {db_e}) when trying to log "
                         f"exception ({error_type}, {e}) to db"
                     )
-                    self._connection = await self._new_connection
+                    await self._reconnect()
 
     async def _load(self, query: str, t: type[Item]):
-        async with self._connection.cursor(row_factory=psycopg.rows.dict_row) as acur:
+        async with self._connect() as connection, connection.cursor(row_factory=psycopg.rows.dict_row) as acur:
             await acur.execute(query)
             async for d in acur:
                 for f in dataclasses.fields(t):
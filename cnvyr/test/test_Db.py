@@ -14,16 +14,27 @@ from ..Db import Db, Item
 if platform.system() == "Windows":
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-Operation = enum.Enum("Operation", ["test_save_load", "test_update__save", "test_update__update", "test_error_logging"])
-
-
-@pytest_asyncio.fixture
-async def db():
-    result = Db(**json.loads(pathlib.Path("credentials.json").read_text()))
+Operation = enum.Enum(
+    "Operation",
+    [
+        "test_save_load",
+        "test_update__save",
+        "test_update__update",
+        "test_error_logging",
+        "test_concurrent_transactions",
+        "test_bulk_create",
+    ],
+)
+
+
+@pytest_asyncio.fixture(params=[None, 4], ids=["connection", "pool"])
+async def db(request: pytest.FixtureRequest):
+    result = Db(**json.loads(pathlib.Path("credentials.json").read_text()), pool_max_size=request.param)
     await result.init()
     await result.wipe()
     yield result
     await result.wipe()
+    await result.close()
 
 
 E = enum.Enum("E", ["A", "B"])
@@ -82,11 +93,12 @@ async def test_error_logging(db: Db):
     for i in range(3):
         async with db.error_logging(operation):
             raise ValueError(error_text)
-        result = await (
-            await db._connection.execute(
-                "select operation, first, last, error_type, error_text, amount from cnvyr_errors"
-            )
-        ).fetchall()
+        async with db._connect() as connection:
+            result = await (
+                await connection.execute(
+                    "select operation, first, last, error_type, error_text, amount from cnvyr_errors"
+                )
+            ).fetchall()
         assert len(result) == 1
         assert result[0][0] == operation.name
         if i == 0:
@@ -99,7 +111,44 @@ async def test_error_logging(db: Db):
 
     async with db.error_logging(operation):
         pass
-    result = await (
-        await db._connection.execute("select operation, first, last, error_type, error_text, amount from cnvyr_errors")
-    ).fetchall()
+    async with db._connect() as connection:
+        result = await (
+            await connection.execute("select operation, first, last, error_type, error_text, amount from cnvyr_errors")
+        ).fetchall()
     assert not result
+
+
+@pytest.mark.asyncio
+async def test_concurrent_transactions(db: Db):
+    created = datetime.datetime.now()
+    await asyncio.gather(
+        *(
+            db.transaction(Operation.test_concurrent_transactions, C(digest=str(i).encode(), created=created))
+            for i in range(32)
+        )
+    )
+    result = [r async for r in C.load_from(db, "select * from c")]
+    assert sorted(r.digest for r in result) == sorted(str(i).encode() for i in range(32))
+
+
+@pytest.mark.asyncio
+async def test_bulk_create(db: Db):
+    created = datetime.datetime.now()
+    items = [C(digest=str(i).encode(), created=created, test_int=i) for i in range(db.copy_threshold * 2)]
+    await db.transaction(Operation.test_bulk_create, C(digest=b"single", created=created), *items)
+
+    result = [r async for r in C.load_from(db, "select * from c where digest != 'single' order by id")]
+    assert result == items
+    assert len({r.id for r in result}) == len(items)
+
+    async with db._connect() as connection:
+        log = await (
+            await connection.execute(
+                "select item_id, key::text, value from cnvyr_log where operation=%s order by id",
+                (Operation.test_bulk_create.name,),
+            )
+        ).fetchall()
+    fields = [f.name for f in dataclasses.fields(C) if f.name != "id"]
+    assert len(log) == len(fields) * (len(items) + 1)
+    for r in result:
+        assert {k: v for i, k, v in log if i == r.id} == {k: str(db._asdict(r)[k]) for k in fields}